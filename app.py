@@ -1,6 +1,11 @@
+import hashlib
+import io
+import os
 import streamlit as st
 import geopandas as gpd
 import rasterio as rio
+from rasterio.transform import Affine, array_bounds
+from rasterio.warp import reproject, Resampling
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
@@ -10,6 +15,75 @@ import contextily as ctx
 import pandas as pd
 from matplotlib.colors import Normalize
 from matplotlib.cm import ScalarMappable
+
+# Decoded rasters are written here once as .npy files and memory-mapped read-only,
+# so every session and every server process shares the same pages in memory.
+RASTER_CACHE_DIR = ".raster_cache"
+
+
+def _shared_array(source_path, build, cache_name=None):
+    """
+    Return a read-only memory map of the array produced by build().
+    The array is materialised once in RASTER_CACHE_DIR and rebuilt when source_path is newer.
+    Callers keeping the result in an in-memory cache must key it on the mtime of source_path.
+    :param source_path: Path of the file the array is derived from.
+    :param build: Zero-argument callable returning the array to store.
+    :param cache_name: Name of the cached file, defaults to the name of source_path.
+    :return: Read-only numpy memmap.
+    """
+    os.makedirs(RASTER_CACHE_DIR, exist_ok=True)
+    if cache_name is None:
+        cache_name = os.path.splitext(os.path.basename(source_path))[0]
+    cache_path = os.path.join(RASTER_CACHE_DIR, cache_name + ".npy")
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(source_path):
+        # Write to a per-process temporary file so concurrent workers never see a partial array
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            np.save(file, build())
+        os.replace(tmp_path, cache_path)
+    return np.load(cache_path, mmap_mode='r')
+
+
+@st.cache_resource(show_spinner=False)
+def _load_raster(raster_path, mtime):
+    """Cached body of load_raster(), keyed on the modification time of the raster."""
+    with rio.open(raster_path) as src:
+        band = _shared_array(raster_path, lambda: src.read(1))
+        return band, src.bounds, src.crs
+
+
+def load_raster(raster_path):
+    """
+    Read the first band of a raster once per server process and share it across sessions.
+    The raster is read again when the file changes on disk.
+    The returned array is read-only: copy it before modifying values.
+    :param raster_path: Path to the GeoTIFF.
+    :return: Tuple (band, bounds, crs).
+    """
+    return _load_raster(raster_path, os.path.getmtime(raster_path))
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _figure_png(key, _draw):
+    """Render the figure returned by _draw() to PNG bytes, cached by key for all sessions."""
+    fig = _draw()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')  # Same resolution as st.pyplot
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def show_figure(draw, *key, sources=()):
+    """
+    Display a figure that is rendered only once for a given key.
+    :param draw: Zero-argument callable building the matplotlib figure.
+    :param key: Hashable values identifying the figure (plot name and its inputs).
+    :param sources: Paths of the rasters drawn, the figure is rendered again when one of them changes.
+    """
+    key = key + tuple((path, os.path.getmtime(path)) for path in sources)
+    st.image(_figure_png(key, draw), width="stretch")
+
+
 def adapt_raster(old_raster):
     """
     Adapt an old raster to the new classification system.
@@ -44,26 +118,32 @@ def adapt_raster(old_raster):
     return new_raster
 
 
+def preprocess_raster(raster, raster_path):
+    """
+    Bring a land cover raster to the classes of the colour palette.
+    :param raster: Writable 2D numpy array, modified in place for projected rasters.
+    :param raster_path: Path of the raster, used to tell projected from historical data.
+    :return: 2D numpy array with palette class codes.
+    """
+    if 'RCP' in raster_path or 'SSP' in raster_path:
+        raster[(raster > 14) & (raster < 24)] = 15
+        raster[raster >= 24] = 16
+    else:
+        raster = adapt_raster(raster)
+    return raster
+
+
 def transitions_calc(raster1_path, raster2_path, lc_sources, lc_target):
     """Function to outline the transition from multiple land cover classes to a target class"""
 
-    # Read raster data
-    with rio.open(raster1_path) as src:
-        raster1 = src.read(1)
-        map_extent = [src.bounds.left, src.bounds.right, src.bounds.bottom, src.bounds.top]
+    # Read raster data (copies, since the shared arrays are read-only)
+    raster1, bounds, crs = load_raster(raster1_path)
+    raster1 = np.array(raster1)
+    map_extent = [bounds.left, bounds.right, bounds.bottom, bounds.top]
 
-    with rio.open(raster2_path) as src:
-        raster2 = src.read(1)
+    raster2 = np.array(load_raster(raster2_path)[0])
 
     # Adapt raster values if needed
-    def preprocess_raster(raster, raster_path):
-        if 'RCP' in raster_path or 'SSP' in raster_path:
-            raster[(raster > 14) & (raster < 24)] = 15
-            raster[raster >= 24] = 16
-        else:
-            raster = adapt_raster(raster)
-        return raster
-
     raster1 = preprocess_raster(raster1, raster1_path)
     raster2 = preprocess_raster(raster2, raster2_path)
 
@@ -80,8 +160,6 @@ def transitions_calc(raster1_path, raster2_path, lc_sources, lc_target):
     for lc in lc_sources:
         transition[(raster1 == lc) & (raster2 == lc_target)] = 1
 
-    crs = src.crs  # Get coordinate reference system
-
     return transition, map_extent, crs
 
 def transition_viz(transition, lc_sources, lc_target, map_extent, crs):
@@ -100,10 +178,83 @@ def transition_viz(transition, lc_sources, lc_target, map_extent, crs):
 
     return fig
 
+@st.cache_resource(show_spinner=False)
+def _reference_grid(raster_path, mtime):
+    """Cached body of reference_grid(), keyed on the modification time of the raster."""
+    with rio.open(raster_path) as src:
+        return src.crs.to_string(), tuple(src.transform)[:6], (src.height, src.width)
+
+
+def reference_grid(raster_path):
+    """
+    Grid of a raster, to be used as target of harmonize().
+    :param raster_path: Path to the GeoTIFF defining the grid.
+    :return: Tuple (crs, transform coefficients, shape).
+    """
+    return _reference_grid(raster_path, os.path.getmtime(raster_path))
+
+
+@st.cache_resource(show_spinner=False)
+def _harmonize(raster_path, mtime, grid, method, classes):
+    """Cached body of harmonize(), keyed on the modification time of the source raster."""
+    dst_crs, dst_transform, dst_shape = grid
+    digest = hashlib.sha1(repr((raster_path, grid, method, classes)).encode()).hexdigest()[:16]
+    cache_name = f"{os.path.splitext(os.path.basename(raster_path))[0]}_{method}_{digest}"
+
+    def build():
+        with rio.open(raster_path) as src:
+            band = src.read(1).astype(np.float32)
+            missing = ~np.isfinite(band)
+            if src.nodata is not None:
+                missing |= band == src.nodata
+
+            if method == 'fraction':
+                # 1 inside the classes, 0 outside, averaged into the fraction of each target cell
+                band[missing] = 0
+                band = np.asarray(preprocess_raster(band, raster_path), dtype=np.float32)
+                band = np.where(band > 0, np.isin(band, classes), np.nan).astype(np.float32)
+                resampling = Resampling.average
+            else:
+                band[missing] = np.nan
+                resampling = Resampling[method]
+
+            harmonized = np.full(dst_shape, np.nan, dtype=np.float32)
+            reproject(
+                source=band,
+                destination=harmonized,
+                src_transform=src.transform,
+                src_crs=src.crs,
+                src_nodata=np.nan,
+                dst_transform=Affine(*dst_transform),
+                dst_crs=dst_crs,
+                dst_nodata=np.nan,
+                resampling=resampling
+            )
+        return harmonized
+
+    return _shared_array(raster_path, build, cache_name=cache_name)
+
+
+def harmonize(raster_path, grid, method='nearest', classes=None):
+    """
+    Reproject and resample a raster onto a reference grid.
+    Results are cached on disk by (source, target grid, method, classes) and shared read-only,
+    and computed again when the source raster changes.
+    :param raster_path: Path to the source GeoTIFF.
+    :param grid: Target grid as returned by reference_grid().
+    :param method: Name of a rasterio Resampling method, or 'fraction' to aggregate
+                   the share of valid pixels belonging to classes in each target cell.
+    :param classes: Tuple of palette class codes counted by the 'fraction' method.
+    :return: Read-only float32 array on the target grid, NaN where there is no data.
+    """
+    if method == 'fraction' and not classes:
+        raise ValueError("The 'fraction' method needs the classes to count")
+    return _harmonize(raster_path, os.path.getmtime(raster_path), grid, method, classes)
+
 # Define available scenarios and time periods
 rcp_scenarios = ["RCP45", "RCP85"]
 ssp_scenarios = ["SSP1", "SSP2", "SSP3", "SSP4", "SSP5"]
-rcp_ssp_scenarios = ["SSP1-RCP2.6", "SSP2-RCP4.5", "SSP3-RPC7.0", "SSP4-RCP3.4", "SSP4-RCP6.0", "SSP5-RCP3.4", "SSP5-RCP8.5"]
+rcp_ssp_scenarios = ["SSP1-RCP2.6", "SSP2-RCP4.5", "SSP3-RCP7.0", "SSP4-RCP3.4", "SSP4-RCP6.0", "SSP5-RCP3.4", "SSP5-RCP8.5"]
 
 historical_time_periods = ["1979_1985", "1992_1997", "2004_2009", "2013_2018"]
 rcp_future_time_periods = ["2020_2045", "2045_2074", "2070_2099"]
@@ -184,69 +335,85 @@ raster_paths_rcpssp = {f"{time_period}_{scenario}": f"clipped_raster/clipped_{sc
 
 # Load color mapping from file
 color_file_path = "Visualization/ColourPalette.txt"
-land_cover_colors = {}
-land_cover_labels = {}
-
-with open(color_file_path, 'r') as file:
-    for line in file:
-        parts = line.strip().split(',')
-        if len(parts) >= 6:
-            class_id = int(parts[0])
-            r, g, b, a = float(parts[1])/255, float(parts[2])/255, float(parts[3])/255, float(parts[4])/255
-            label = ' '.join(parts[5:])
-            land_cover_colors[class_id] = (r, g, b, a)
-            land_cover_labels[class_id] = label
+
+@st.cache_resource(show_spinner=False)
+def load_palette(color_file_path):
+    """
+    Parse the land cover colour palette once per server process.
+    :param color_file_path: Path to the palette file (class_id,r,g,b,a,label).
+    :return: Tuple (colors, labels, unique_classes, cmap, norm) shared by all sessions.
+    """
+    land_cover_colors = {}
+    land_cover_labels = {}
+
+    with open(color_file_path, 'r') as file:
+        for line in file:
+            parts = line.strip().split(',')
+            if len(parts) >= 6:
+                class_id = int(parts[0])
+                r, g, b, a = float(parts[1])/255, float(parts[2])/255, float(parts[3])/255, float(parts[4])/255
+                label = ' '.join(parts[5:])
+                land_cover_colors[class_id] = (r, g, b, a)
+                land_cover_labels[class_id] = label
+
+    # Colormap lookup table for the land cover classes
+    unique_classes = np.unique(list(land_cover_colors.keys()))
+    unique_classes.setflags(write=False)
+    color_list = [land_cover_colors.get(cls, (0, 0, 0, 1)) for cls in unique_classes]
+    cmap = mcolors.ListedColormap([color[:3] for color in color_list])  # Remove alpha
+    norm = mcolors.BoundaryNorm(unique_classes.tolist() + [max(unique_classes) + 1], cmap.N)
+
+    return land_cover_colors, land_cover_labels, unique_classes, cmap, norm
+
+land_cover_colors, land_cover_labels, land_cover_classes, land_cover_cmap, land_cover_norm = load_palette(color_file_path)
 
 def display_raster_RCP(raster_file, selected_scenario=None, time_period=None):
     """Function to display a land cover raster"""
-    with rio.open(raster_file) as src:
-        land_cover = src.read(1)
-        if selected_scenario is not None:
-            land_cover[land_cover<=0] = np.nan
-            land_cover[(land_cover>14) & (land_cover<24)] = 15
-            land_cover[land_cover>=24] = 16
-        else:
-            land_cover = adapt_raster(land_cover)
-            land_cover[land_cover==0] = np.nan  
-
-        # Set up colors and visualization
-        unique_classes = np.unique(list(land_cover_colors.keys()))
-        color_list = [land_cover_colors.get(cls, (0, 0, 0, 1)) for cls in unique_classes]
-        cmap = mcolors.ListedColormap([color[:3] for color in color_list])  # Remove alpha
-        norm = mcolors.BoundaryNorm(unique_classes.tolist() + [max(unique_classes) + 1], cmap.N)
-
-        # Create figure and plot raster
-        fig, ax = plt.subplots(figsize=(10, 8))
-        img = ax.imshow(land_cover, cmap=cmap, norm=norm, extent=[src.bounds.left, src.bounds.right, src.bounds.bottom, src.bounds.top], zorder=2, alpha=0.7)
-        ctx.add_basemap(ax, crs='epsg:2056', attribution=1, zorder=1)
-
-        # Set title
-        title = time_period
-        if selected_scenario:
-            title = f"{selected_scenario} - {time_period}"
-        ax.set_title(title)
-        ax.axis("off")
+    land_cover, bounds, crs = load_raster(raster_file)
+    land_cover = np.array(land_cover)  # Writable copy of the shared array
+    if selected_scenario is not None:
+        land_cover[land_cover<=0] = np.nan
+        land_cover[(land_cover>14) & (land_cover<24)] = 15
+        land_cover[land_cover>=24] = 16
+    else:
+        land_cover = adapt_raster(land_cover)
+        land_cover[land_cover==0] = np.nan  
 
-        # Create a colorbar legend
-        ax_legend = fig.add_axes([0.1, 0.1, 0.8, 0.05])  # Position for legend
-        sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-        sm.set_array([])  # Dummy array for colorbar
+    # Set up colors and visualization
+    unique_classes = land_cover_classes
+    cmap = land_cover_cmap
+    norm = land_cover_norm
 
-        cb = plt.colorbar(sm, cax=ax_legend, orientation='horizontal')
-        cb.set_ticks(unique_classes+0.5)
-        cb.ax.set_xticklabels([land_cover_labels.get(cls, "") for cls in unique_classes], rotation=360-60)
+    # Create figure and plot raster
+    fig, ax = plt.subplots(figsize=(10, 8))
+    img = ax.imshow(land_cover, cmap=cmap, norm=norm, extent=[bounds.left, bounds.right, bounds.bottom, bounds.top], zorder=2, alpha=0.7)
+    ctx.add_basemap(ax, crs='epsg:2056', attribution=1, zorder=1)
 
-        # Adjust legend appearance
-        cb.ax.tick_params(labelsize=8)
-        cb.ax.set_title("Land Cover Classes", fontsize=10)
-        
-        return fig
+    # Set title
+    title = time_period
+    if selected_scenario:
+        title = f"{selected_scenario} - {time_period}"
+    ax.set_title(title)
+    ax.axis("off")
+
+    # Create a colorbar legend
+    ax_legend = fig.add_axes([0.1, 0.1, 0.8, 0.05])  # Position for legend
+    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
+    sm.set_array([])  # Dummy array for colorbar
+
+    cb = plt.colorbar(sm, cax=ax_legend, orientation='horizontal')
+    cb.set_ticks(unique_classes+0.5)
+    cb.ax.set_xticklabels([land_cover_labels.get(cls, "") for cls in unique_classes], rotation=360-60)
+
+    # Adjust legend appearance
+    cb.ax.tick_params(labelsize=8)
+    cb.ax.set_title("Land Cover Classes", fontsize=10)
+    
+    return fig
     
 def display_raster_SSP(raster_file, selected_scenario=None, time_period=None):
     print(raster_file)
-    with rio.open(raster_file) as src:
-        land_cover = src.read(1)
-        crs= src.crs
+    land_cover, bounds, crs = load_raster(raster_file)
 
     # Define colors: transparent, light blue, red
     colors = [(1, 1, 1, 0),  # Transparent for other values
@@ -261,7 +428,7 @@ def display_raster_SSP(raster_file, selected_scenario=None, time_period=None):
 
 
     fig, ax = plt.subplots(figsize=(10, 8))
-    img = ax.imshow(land_cover, cmap=cmap, norm=norm, extent=[src.bounds.left, src.bounds.right, src.bounds.bottom, src.bounds.top], zorder=2, alpha=0.7)
+    img = ax.imshow(land_cover, cmap=cmap, norm=norm, extent=[bounds.left, bounds.right, bounds.bottom, bounds.top], zorder=2, alpha=0.7)
     ctx.add_basemap(ax, crs=crs, attribution=1, zorder=1)
 
     title = time_period
@@ -279,10 +446,7 @@ def display_raster_SSP(raster_file, selected_scenario=None, time_period=None):
 
 def display_raster_rcpssp(raster_file, selected_scenario=None, time_period=None):
     print(raster_file)
-    with rio.open(raster_file) as src:
-        land_cover = src.read(1)
-        crs = src.crs
-        bounds = src.bounds
+    land_cover, bounds, crs = load_raster(raster_file)
 
     # Create a colormap from transparent -> yellow -> orange -> red
     colors = [
@@ -322,6 +486,186 @@ def display_raster_rcpssp(raster_file, selected_scenario=None, time_period=None)
 
     return fig
 
+def urban_transition_viz(raster1, raster2):
+    """Function to visualize the urban transition between two SSP rasters (1 = non-urban, 2 = urban)"""
+    # Load both rasters
+    data1, bounds, crs = load_raster(raster_paths[raster1])
+    data2 = load_raster(raster_paths[raster2])[0]
+
+    # Identify transitions
+    new_urban = np.logical_and(data1 != 2 , data2 == 2)
+    old_urban = np.logical_and(data1 == 2, data2 == 2)
+    # Optionally: lost urban → other
+    # lost_urban = np.logical_and(data1 == 2, data2 == 1)
+
+    # Create a display map
+    transition_map = np.zeros(data1.shape, dtype=data1.dtype)
+    transition_map[old_urban] = 1
+    transition_map[new_urban] = 2
+    # transition_map[lost_urban] = 3  # Optional
+
+    # Colormap: 0 = transparent, 1 = old urban (red), 2 = new urban (orange)
+    cmap = ListedColormap([
+        (1, 1, 1, 0),        # 0: Transparent
+        (1, 0, 0, 1),        # 1: Old urban - Red
+        (1, 0.5, 0, 1),      # 2: New urban - Orange
+    ])
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    img = ax.imshow(
+        transition_map,
+        cmap=cmap,
+        extent=[bounds.left, bounds.right, bounds.bottom, bounds.top],
+        zorder=2
+    )
+    ctx.add_basemap(ax, crs=crs, attribution=1, zorder=1)
+    ax.set_title(f"Urban Transition: {raster1} → {raster2}")
+    ax.axis("off")
+
+    # Legend
+    red_patch = mpatches.Patch(color='red', label='Stable urban')
+    orange_patch = mpatches.Patch(color='orange', label='New urban')
+    ax.legend(handles=[red_patch, orange_patch], loc='lower left', frameon=True)
+
+    return fig
+
+def urban_change_viz(raster1, raster2):
+    """Function to visualize the change in urban percentage between two SSP-RCP rasters"""
+    # Load raster data
+    data1, bounds, crs = load_raster(raster_paths_rcpssp[raster1])
+    data1 = data1.astype(float)
+    data2 = load_raster(raster_paths_rcpssp[raster2])[0].astype(float)
+
+    # Calculate change in urban %
+    delta = data2 - data1  # positive = urban increase
+
+    # Visualization setup
+    # We'll use a diverging colormap: blue (decrease), white (no change), red (increase)
+    cmap = LinearSegmentedColormap.from_list("urban_change", [
+        (0, 1, 1, 0),     # White - no change
+        (1, 1, 0, 1),        # ~33: Yellow
+        (1, 0.65, 0, 1),     # ~66: Orange
+        (1, 0, 0, 1)      # Red 
+    ])
+
+    # Center at 0, clip changes to avoid outlier stretch
+    max_abs_change = np.nanpercentile(np.abs(delta), 99)
+    norm = plt.Normalize(vmin=0, vmax=max_abs_change)
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    img = ax.imshow(delta, cmap=cmap, norm=norm,
+                    extent=[bounds.left, bounds.right, bounds.bottom, bounds.top],
+                    zorder=2)
+    ctx.add_basemap(ax, crs=crs, attribution=1, zorder=1)
+    ax.set_title(f"Urban % Change: {raster1} → {raster2}")
+    ax.axis("off")
+
+    # Colorbar
+    cbar = fig.colorbar(img, ax=ax, orientation='horizontal', fraction=0.046, pad=0.04)
+    cbar.set_label('Change in impervious surface area (%)')
+    cbar.set_ticks([0, max_abs_change])
+    cbar.set_ticklabels(["0%", f"+{int(max_abs_change)}%"])
+
+    return fig
+
+# Palette classes counted as urban land cover
+urban_land_cover_classes = (1, 2, 3, 15)  # Industry, Building, Special urban, Transportation
+
+def cross_family_path(raster_key):
+    """Path of a raster of any scenario family"""
+    return raster_paths_rcpssp.get(raster_key, raster_paths.get(raster_key))
+
+@st.cache_resource(show_spinner=False)
+def existing_rasters(raster_keys):
+    """Keys among raster_keys whose file exists, checked once per server process"""
+    return tuple(r for r in raster_keys if os.path.exists(cross_family_path(r)))
+
+cross_family_rasters = existing_rasters(tuple(raster_paths) + tuple(raster_paths_rcpssp))
+
+def urban_share(raster_key, grid):
+    """
+    Urban share (%) of each cell of the reference grid, for a raster of any scenario family.
+    :param raster_key: Key in raster_paths or raster_paths_rcpssp.
+    :param grid: Target grid as returned by reference_grid().
+    :return: 2D numpy array of percentages, NaN where there is no data.
+    """
+    if raster_key in raster_paths_rcpssp:
+        # gISA rasters already hold the percentage of impervious surface
+        return harmonize(raster_paths_rcpssp[raster_key], grid, 'average')
+    if raster_key.startswith('SSP'):
+        # SSP urban masks: 1 = non-urban, 2 = urban
+        return harmonize(raster_paths[raster_key], grid, 'fraction', (2,)) * 100
+    return harmonize(raster_paths[raster_key], grid, 'fraction', urban_land_cover_classes) * 100
+
+def cross_family_viz(raster1, raster2, reference):
+    """Function to visualize the urban share of two rasters of any family on a common grid"""
+    grid = reference_grid(cross_family_path(reference))
+    crs, transform, shape = grid
+    west, south, east, north = array_bounds(shape[0], shape[1], Affine(*transform))
+    extent = [west, east, south, north]
+
+    share1 = urban_share(raster1, grid)
+    share2 = urban_share(raster2, grid)
+    delta = share2 - share1
+
+    fig, axes = plt.subplots(1, 3, figsize=(18, 6))
+    urban_cmap = LinearSegmentedColormap.from_list("urban_share", [
+        (1, 1, 1, 0),        # 0: Fully transparent
+        (1, 1, 0, 1),        # Yellow
+        (1, 0.65, 0, 1),     # Orange
+        (1, 0, 0, 1),        # 100: Red
+    ])
+    for ax, share, name in zip(axes[:2], [share1, share2], [raster1, raster2]):
+        img = ax.imshow(share, cmap=urban_cmap, norm=plt.Normalize(vmin=0, vmax=100), extent=extent, zorder=2)
+        ctx.add_basemap(ax, crs=crs, attribution=1, zorder=1)
+        ax.set_title(f"Urban share: {name}")
+        ax.axis("off")
+    cbar = fig.colorbar(img, ax=axes[:2], orientation='horizontal', fraction=0.046, pad=0.04)
+    cbar.set_label('Urban share of the cell (%)')
+
+    # Symmetric scale, clipped to avoid outlier stretch
+    max_abs_change = max(np.nanpercentile(np.abs(delta), 99), 1)
+    img = axes[2].imshow(delta, cmap='coolwarm', norm=plt.Normalize(vmin=-max_abs_change, vmax=max_abs_change),
+                         extent=extent, zorder=2)
+    ctx.add_basemap(axes[2], crs=crs, attribution=1, zorder=1)
+    axes[2].set_title(f"Difference: {raster2} − {raster1}")
+    axes[2].axis("off")
+    cbar = fig.colorbar(img, ax=axes[2], orientation='horizontal', fraction=0.046, pad=0.04)
+    cbar.set_label('Difference in urban share (percentage points)')
+
+    return fig
+
+def show_cross_family_comparison():
+    """Function to compare rasters of different scenario families on a common grid"""
+    st.subheader("Cross-family Urban Comparison")
+    st.write("Land cover classes (Industry, Building, Special urban, Transportation) and SSP urban masks are "
+             "aggregated to the fraction of urban pixels per cell of the reference grid, gISA rasters are resampled as percentages.")
+
+    all_rasters = cross_family_rasters
+    raster1 = st.selectbox("Select first raster:", all_rasters, index=all_rasters.index("2020_2045_RCP45"), key="cross_family_raster1")
+    raster2 = st.selectbox("Select second raster:", all_rasters, index=all_rasters.index("2045_SSP2-RCP4.5"), key="cross_family_raster2")
+
+    # Default to the coarsest grid (fewest cells over the same area), where class fractions are meaningful
+    # The key follows the pair, so the default applies again whenever a raster selection changes
+    cell_counts = [np.prod(reference_grid(cross_family_path(r))[2]) for r in (raster1, raster2)]
+    reference = st.radio("Reference grid:", [raster1, raster2], index=int(np.argmin(cell_counts)),
+                         key=f"cross_family_reference_{raster1}_{raster2}", horizontal=True)
+
+    if raster1 == raster2:
+        st.error("Please select two different rasters.")
+    else:
+        show_figure(lambda: cross_family_viz(raster1, raster2, reference), "cross_family", raster1, raster2, reference,
+                    sources=(cross_family_path(raster1), cross_family_path(raster2)))
+
+        grid = reference_grid(cross_family_path(reference))
+        share1 = urban_share(raster1, grid)
+        share2 = urban_share(raster2, grid)
+        valid = np.isfinite(share1) & np.isfinite(share2)
+        if valid.sum() > 1:
+            correlation = np.corrcoef(share1[valid], share2[valid])[0, 1]
+            st.write(f"Mean urban share: **{np.mean(share1[valid]):.1f}%** ({raster1}) vs **{np.mean(share2[valid]):.1f}%** ({raster2}), "
+                     f"mean absolute difference **{np.mean(np.abs(share2[valid] - share1[valid])):.1f}** points, correlation **{correlation:.2f}**.")
+
 def show_transition_analysis(scenario_type, available_rasters):
     """Function to show transition analysis interface"""
     st.subheader(f"{scenario_type} Transition Analysis")
@@ -349,14 +693,15 @@ def show_transition_analysis(scenario_type, available_rasters):
         lc_source_ids = [list(land_cover_labels.keys())[list(land_cover_labels.values()).index(lc)] for lc in lc_sources]
         lc_target_id = list(land_cover_labels.keys())[list(land_cover_labels.values()).index(lc_target)]
 
-        # Compute transition map
-        transition, map_extent, crs = transitions_calc(
-            raster_paths[raster1], raster_paths[raster2], lc_source_ids, lc_target_id
-        )
+        # Compute transition map and generate visualization
+        def draw():
+            transition, map_extent, crs = transitions_calc(
+                raster_paths[raster1], raster_paths[raster2], lc_source_ids, lc_target_id
+            )
+            return transition_viz(transition, lc_sources, lc_target, map_extent, crs)
 
-        # Generate visualization
-        fig = transition_viz(transition, lc_sources, lc_target, map_extent, crs)
-        st.pyplot(fig)
+        show_figure(draw, "transition", raster1, raster2, tuple(lc_source_ids), lc_target_id,
+                    sources=(raster_paths[raster1], raster_paths[raster2]))
 
         # Explanation text
         st.write(f"Areas transitioning from **{', '.join(lc_sources)}** to **{lc_target}** are highlighted.")
@@ -376,51 +721,8 @@ def show_transition_analysis_ssp(scenario_type, available_rasters):
     if raster1 == raster2:
         st.error("Please select two different rasters.")
     else:
-        # Load both rasters
-        with rio.open(raster_paths[raster1]) as src1:
-            data1 = src1.read(1)
-            bounds = src1.bounds
-            crs = src1.crs
-
-        with rio.open(raster_paths[raster2]) as src2:
-            data2 = src2.read(1)
-
-        # Identify transitions
-        new_urban = np.logical_and(data1 != 2 , data2 == 2)
-        old_urban = np.logical_and(data1 == 2, data2 == 2)
-        # Optionally: lost urban → other
-        # lost_urban = np.logical_and(data1 == 2, data2 == 1)
-
-        # Create a display map
-        transition_map = np.zeros_like(data1)
-        transition_map[old_urban] = 1
-        transition_map[new_urban] = 2
-        # transition_map[lost_urban] = 3  # Optional
-
-        # Colormap: 0 = transparent, 1 = old urban (red), 2 = new urban (orange)
-        cmap = ListedColormap([
-            (1, 1, 1, 0),        # 0: Transparent
-            (1, 0, 0, 1),        # 1: Old urban - Red
-            (1, 0.5, 0, 1),      # 2: New urban - Orange
-        ])
-
-        fig, ax = plt.subplots(figsize=(10, 8))
-        img = ax.imshow(
-            transition_map,
-            cmap=cmap,
-            extent=[bounds.left, bounds.right, bounds.bottom, bounds.top],
-            zorder=2
-        )
-        ctx.add_basemap(ax, crs=crs, attribution=1, zorder=1)
-        ax.set_title(f"Urban Transition: {raster1} → {raster2}")
-        ax.axis("off")
-
-        # Legend
-        red_patch = mpatches.Patch(color='red', label='Stable urban')
-        orange_patch = mpatches.Patch(color='orange', label='New urban')
-        ax.legend(handles=[red_patch, orange_patch], loc='lower left', frameon=True)
-
-        st.pyplot(fig)
+        show_figure(lambda: urban_transition_viz(raster1, raster2), "urban_transition", raster1, raster2,
+                    sources=(raster_paths[raster1], raster_paths[raster2]))
         st.write(f"**New urban areas** (orange) are where land changed from non-urban to urban between {raster1} and {raster2}.")
         st.write("**Stable urban areas** (red) remained urban in both time periods.")
 
@@ -439,46 +741,8 @@ def show_transition_analysis_rcpssp(scenario_type, available_rasters):
     if raster1 == raster2:
         st.error("Please select two different rasters.")
     else:
-        # Load raster data
-        with rio.open(raster_paths_rcpssp[raster1]) as src1:
-            data1 = src1.read(1).astype(float)
-            bounds = src1.bounds
-            crs = src1.crs
-
-        with rio.open(raster_paths_rcpssp[raster2]) as src2:
-            data2 = src2.read(1).astype(float)
-
-        # Calculate change in urban %
-        delta = data2 - data1  # positive = urban increase
-
-        # Visualization setup
-        # We'll use a diverging colormap: blue (decrease), white (no change), red (increase)
-        cmap = LinearSegmentedColormap.from_list("urban_change", [
-            (0, 1, 1, 0),     # White - no change
-            (1, 1, 0, 1),        # ~33: Yellow
-            (1, 0.65, 0, 1),     # ~66: Orange
-            (1, 0, 0, 1)      # Red 
-        ])
-
-        # Center at 0, clip changes to avoid outlier stretch
-        max_abs_change = np.nanpercentile(np.abs(delta), 99)
-        norm = plt.Normalize(vmin=0, vmax=max_abs_change)
-
-        fig, ax = plt.subplots(figsize=(10, 8))
-        img = ax.imshow(delta, cmap=cmap, norm=norm,
-                        extent=[bounds.left, bounds.right, bounds.bottom, bounds.top],
-                        zorder=2)
-        ctx.add_basemap(ax, crs=crs, attribution=1, zorder=1)
-        ax.set_title(f"Urban % Change: {raster1} → {raster2}")
-        ax.axis("off")
-
-        # Colorbar
-        cbar = fig.colorbar(img, ax=ax, orientation='horizontal', fraction=0.046, pad=0.04)
-        cbar.set_label('Change in impervious surface area (%)')
-        cbar.set_ticks([0, max_abs_change])
-        cbar.set_ticklabels(["0%", f"+{int(max_abs_change)}%"])
-
-        st.pyplot(fig)
+        show_figure(lambda: urban_change_viz(raster1, raster2), "urban_change", raster1, raster2,
+                    sources=(raster_paths_rcpssp[raster1], raster_paths_rcpssp[raster2]))
         st.write(f"**Red areas** show increased urbanization between {raster1} and {raster2}.")
         st.write("**Blue areas** show decreased urbanization. **White areas** stayed about the same.")
 
@@ -535,12 +799,34 @@ def plot_preferred_infra(geodf, col_names):
     ax.set_title('Preferred infrastructure - Lausanne and neighbors', fontsize=8)
     return fig
 
+@st.cache_resource(show_spinner=False)
+def load_survey(infra_path, borders_path):
+    """
+    Load the survey results and district borders once per server process.
+    The returned frames are shared by all sessions and must not be modified in place.
+    :param infra_path: CSV of infrastructure preferences per region (in %).
+    :param borders_path: Shapefile of the district borders.
+    :return: Tuple (percentages, merged) with preferences on a 0-1 scale.
+    """
+    infra_file = pd.read_csv(infra_path)
+    percentages = infra_file.drop(columns=['Total Canton Vaud']).set_index('Region').T.reset_index(names=['canton'])
+    cols = percentages.drop(columns=['canton']).columns
+    for col in cols:
+        percentages[col] = round(percentages[col] / 100, 3)  # convert to 0–1 scale
+
+    admin_borders = gpd.read_file(borders_path)
+
+    # --- Merge geodata with percentages ---
+    merged = pd.merge(admin_borders, percentages, left_on='NOM_MIN', right_on='canton', how='right')
+    merged = gpd.GeoDataFrame(merged)
+    return percentages, merged
+
 # Streamlit UI  
 st.set_page_config(layout="wide")
 st.title("Land Cover Scenario Viewer")
 
 # Main tab selection - RCP vs SSP
-tab_rcp, tab_ssp, tab_rcp_ssp, tab_survey = st.tabs(["RCP Scenarios", "SSP (shared spatio-temporal pathways) Scenarios", "RCP-SSP Scenarios", "Survey results"])
+tab_rcp, tab_ssp, tab_rcp_ssp, tab_cross_family, tab_survey = st.tabs(["RCP Scenarios", "SSP (shared spatio-temporal pathways) Scenarios", "RCP-SSP Scenarios", "Cross-family comparison", "Survey results"])
 
 # RCP Tab
 with tab_rcp:
@@ -564,8 +850,8 @@ with tab_rcp:
 
 
         if raster_key in raster_paths:
-            fig = display_raster_RCP(raster_paths[raster_key], selected_scenario=rcp_scenario, time_period=rcp_time_period)
-            st.pyplot(fig)
+            show_figure(lambda: display_raster_RCP(raster_paths[raster_key], selected_scenario=rcp_scenario, time_period=rcp_time_period),
+                        "rcp", raster_key, rcp_scenario, rcp_time_period, sources=(raster_paths[raster_key],))
         else:
             st.error("Raster file not found for the selected scenario and time period.")
     
@@ -591,8 +877,8 @@ with tab_ssp:
         
         raster_key = f"{ssp_scenario}_{ssp_time_period}"
         if raster_key in raster_paths:
-            fig = display_raster_SSP(raster_paths[raster_key], selected_scenario=ssp_scenario, time_period=ssp_time_period)
-            st.pyplot(fig)
+            show_figure(lambda: display_raster_SSP(raster_paths[raster_key], selected_scenario=ssp_scenario, time_period=ssp_time_period),
+                        "ssp", raster_key, sources=(raster_paths[raster_key],))
         else:
             st.error(f"Raster file {raster_paths[raster_key]} not found for the selected scenario and time period.")
     
@@ -616,8 +902,8 @@ with tab_rcp_ssp:
             rcpssp_scenario= st.radio("Select SSP-RCP Scenario:", rcp_ssp_scenarios)
         raster_key = f'{rcpssp_time_period}_{rcpssp_scenario}'
         if raster_key in raster_paths_rcpssp:
-            fig = display_raster_rcpssp(raster_paths_rcpssp[raster_key], selected_scenario=rcpssp_scenario, time_period=rcpssp_time_period)
-            st.pyplot(fig)
+            show_figure(lambda: display_raster_rcpssp(raster_paths_rcpssp[raster_key], selected_scenario=rcpssp_scenario, time_period=rcpssp_time_period),
+                        "rcpssp", raster_key, sources=(raster_paths_rcpssp[raster_key],))
         else:
             st.error(f"Raster file {raster_paths_rcpssp[raster_key]} not found for the selected scenario and time period.")
     with ssp_transition_tab:
@@ -625,38 +911,11 @@ with tab_rcp_ssp:
         rcpssp_rasters = [f"{period}_{scenario}" for period in rcpssp_future_time_periods for scenario in rcp_ssp_scenarios]
         show_transition_analysis_rcpssp("SSP", rcpssp_rasters)
 
-with tab_survey:
-    infra_file = pd.read_csv('survey/infrastructures.csv')
-    percentages = infra_file.drop(columns=['Total Canton Vaud']).set_index('Region').T.reset_index(names=['canton'])
-    #percentages = percentages[percentages['canton'].isin(['Gros-de-Vaud', 'Lausanne','Lavaux-Oron','Morges', 'Ouest lausannois'])]
-    cols = percentages.drop(columns=['canton']).columns
-    for col in cols:
-        percentages[col] = round(percentages[col] / 100, 3)  # convert to 0–1 scale
-
-    print(percentages.max())
-
-    # Normalize canton names
-    #percentages.loc[percentages["canton"] == 'Ouest Lausannois', "canton"] = "Ouest lausannois"
-
-    admin_borders = gpd.read_file('survey/MN95_CAD_TPR_LAD_MO_DISTRICT.shp')
-
-    # --- Merge geodata with percentages ---
-    merged = pd.merge(admin_borders, percentages, left_on='NOM_MIN', right_on='canton', how='right')
-    merged = gpd.GeoDataFrame(merged)
-
+with tab_cross_family:
+    show_cross_family_comparison()
 
 with tab_survey:
-    infra_file = pd.read_csv('survey/infrastructures.csv')
-    percentages = infra_file.drop(columns=['Total Canton Vaud']).set_index('Region').T.reset_index(names=['canton'])
-    cols = percentages.drop(columns=['canton']).columns
-    for col in cols:
-        percentages[col] = round(percentages[col] / 100, 3)  # convert to 0–1 scale
-
-    admin_borders = gpd.read_file('survey/MN95_CAD_TPR_LAD_MO_DISTRICT.shp')
-
-    # --- Merge geodata with percentages ---
-    merged = pd.merge(admin_borders, percentages, left_on='NOM_MIN', right_on='canton', how='right')
-    merged = gpd.GeoDataFrame(merged)
+    percentages, merged = load_survey('survey/infrastructures.csv', 'survey/MN95_CAD_TPR_LAD_MO_DISTRICT.shp')
 
     # Sub-tab for selecting multiple infrastructures
     sub_tab_single, sub_tab_multiple = st.tabs(["Single Infrastructure", "Multiple Infrastructures"])
@@ -664,13 +923,11 @@ with tab_survey:
         selected_col = 'Parc de panneaux solaires'
         selected_col = st.selectbox(label='Type of infrastructure', options = percentages.drop(columns=["canton"]).columns)
         print(merged[selected_col])
-        fig = plot_viz_survey(merged, selected_col)
-        st.pyplot(fig)
+        show_figure(lambda: plot_viz_survey(merged, selected_col), "survey", selected_col)
     with sub_tab_multiple:
         selected_cols = st.multiselect(label='Types of infrastructure', options=percentages.drop(columns=["canton"]).columns)
 
         if selected_cols:
-            fig = plot_preferred_infra(merged, selected_cols)
-            st.pyplot(fig)
+            show_figure(lambda: plot_preferred_infra(merged, selected_cols), "preferred_infra", tuple(selected_cols))
         else:
             st.write("Please select at least one infrastructure.")
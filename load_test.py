@@ -0,0 +1,309 @@
+"""
+Local load test for the Land Cover Scenario Viewer.
+
+Starts one `streamlit run app.py` server, connects N concurrent client sessions to it over
+the Streamlit websocket and clicks through the widgets of every tab like a browser would.
+The server RSS/PSS is sampled during the whole run, so the report shows how memory grows
+as sessions are added, next to the p50/p95 latency of first page loads and of interactions.
+
+Requires the `websockets` package (installed with recent Streamlit versions).
+
+Usage:
+    python load_test.py --sessions 30 --steps 20 --ramp 1
+"""
+import argparse
+import asyncio
+import random
+import socket
+import subprocess
+import sys
+import time
+import traceback
+import urllib.request
+
+import numpy as np
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+APP_FILE = "app.py"
+WIDGET_TYPES = ("radio", "selectbox", "multiselect")
+
+
+def server_memory_kb(pid):
+    """
+    Memory of the server process in kB, read from /proc (Linux).
+    :param pid: Process id of the Streamlit server.
+    :return: Tuple (rss_kb, pss_kb), the PSS counts memory-mapped pages shared with other processes only partially.
+    """
+    rss = pss = 0
+    with open(f'/proc/{pid}/status', 'r') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1])
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as file:
+            for line in file:
+                if line.startswith('Pss:'):
+                    pss = int(line.split()[1])
+    except OSError:
+        pss = rss
+    return rss, pss
+
+
+def start_server(port, log_file):
+    """
+    Start `streamlit run app.py` and wait until it answers its health check.
+    :return: The server process.
+    """
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP_FILE, '--server.headless', 'true',
+         '--server.port', str(port), '--browser.gatherUsageStats', 'false'],
+        stdout=log_file, stderr=subprocess.STDOUT
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Streamlit server exited with code {server.returncode}, see {log_file.name}")
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/_stcore/health", timeout=2) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"Streamlit server did not start within 120 s, see {log_file.name}")
+
+
+class Session:
+    """One simulated browser session connected to the Streamlit server."""
+
+    def __init__(self, base_url, rng, timeout):
+        self.base_url = base_url
+        self.rng = rng
+        self.timeout = timeout
+        self.websocket = None
+        self.widgets = {}        # widget id -> (kind, label, options, element proto)
+        self.widget_states = {}  # widget id -> WidgetState sent with every rerun
+
+    async def connect(self):
+        ws_url = self.base_url.replace('http', 'ws', 1) + "/_stcore/stream"
+        self.websocket = await websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        await self.websocket.close()
+
+    async def rerun(self):
+        """
+        Ask the server to run the script with the current widget states, like a browser does after a click.
+        Waits for the end of the run, then downloads the images it displays.
+        :return: List of exception messages shown by the app during the run.
+        """
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.widget_states.widgets.extend(self.widget_states.values())
+        await self.websocket.send(msg.SerializeToString())
+
+        self.widgets = {}
+        image_urls = []
+        exceptions = []
+        while True:
+            forward_msg = ForwardMsg()
+            forward_msg.ParseFromString(await asyncio.wait_for(self.websocket.recv(), self.timeout))
+            kind = forward_msg.WhichOneof("type")
+            if kind == "delta" and forward_msg.delta.WhichOneof("type") == "new_element":
+                element = forward_msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type in WIDGET_TYPES:
+                    widget = getattr(element, element_type)
+                    self.widgets[widget.id] = (element_type, widget.label, list(widget.options), widget)
+                elif element_type == "imgs":
+                    image_urls.extend(image.url for image in element.imgs.imgs)
+                elif element_type == "exception":
+                    exceptions.append(element.exception.message)
+            elif kind == "script_finished" and forward_msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+
+        await asyncio.gather(*(asyncio.to_thread(self._fetch, url) for url in image_urls))
+        return exceptions
+
+    def _fetch(self, url):
+        if url.startswith('data:'):
+            return
+        with urllib.request.urlopen(self.base_url + url, timeout=self.timeout) as response:
+            response.read()
+
+    def click(self):
+        """
+        Change one random widget to a random option.
+        :return: Name of the interaction.
+        """
+        widgets = [(widget_id, widget) for widget_id, widget in self.widgets.items() if widget[2]]
+        if not widgets:
+            raise RuntimeError("No widget to interact with, the app did not render")
+
+        widget_id, (kind, label, options, proto) = self.rng.choice(widgets)
+        state = WidgetState(id=widget_id)
+        if kind == "multiselect":
+            state.string_array_value.data.extend(self.rng.sample(options, self.rng.randint(0, min(3, len(options)))))
+        elif any(field.name == 'raw_value' for field in proto.DESCRIPTOR.fields):
+            state.string_value = self.rng.choice(options)
+        else:
+            # Older Streamlit versions send the index of the option for radio buttons
+            state.int_value = self.rng.randrange(len(options))
+        self.widget_states[widget_id] = state
+        return f"{kind}: {label}"
+
+
+async def run_session(session_id, args, base_url, active):
+    """
+    Simulate one user session: open the app then perform random interactions.
+    :return: Dict with the session id, its records (interaction, latency in seconds, exceptions),
+             whether it completed and the error that stopped it.
+    """
+    session = Session(base_url, random.Random(args.seed + session_id), args.timeout)
+    records = []
+    error = None
+    try:
+        await session.connect()
+        active[0] += 1
+        try:
+            name = "first load"
+            for step in range(args.steps + 1):
+                if step:
+                    await asyncio.sleep(args.think_time)
+                    name = session.click()
+                start = time.perf_counter()
+                exceptions = await session.rerun()
+                records.append((name, time.perf_counter() - start, exceptions))
+        finally:
+            active[0] -= 1
+            await session.close()
+    except Exception:
+        error = traceback.format_exc(limit=3)
+
+    return {
+        'session_id': session_id,
+        'records': records,
+        'completed': error is None and len(records) == args.steps + 1,
+        'error': error,
+    }
+
+
+async def sample_memory(pid, active, samples, interval, stop):
+    """Record (time, active sessions, rss_kb, pss_kb) of the server until stop is set."""
+    start = time.perf_counter()
+    while not stop.is_set():
+        samples.append((time.perf_counter() - start, active[0]) + server_memory_kb(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def percentiles(values):
+    return f"n={len(values):<5} p50: {np.percentile(values, 50):.2f} s  p95: {np.percentile(values, 95):.2f} s"
+
+
+def report(sessions, args, wall_time, baseline, samples):
+    """Print completed sessions, latency percentiles and the server memory as sessions are added."""
+    records = [record for session in sessions for record in session['records']]
+    completed = [session for session in sessions if session['completed']]
+    app_errors = [message for _, _, exceptions in records for message in exceptions]
+
+    print(f"Sessions completed: {len(completed)} / {args.sessions}")
+    print(f"Interactions: {len(records)} / {args.sessions * (args.steps + 1)} in {wall_time:.1f} s "
+          f"({len(app_errors)} app exceptions)")
+
+    first_loads = [latency for name, latency, _ in records if name == "first load"]
+    interactions = [latency for name, latency, _ in records if name != "first load"]
+    if first_loads:
+        print(f"First page load   {percentiles(first_loads)}")
+    if interactions:
+        print(f"Interactions      {percentiles(interactions)}")
+        by_interaction = {}
+        for name, latency, _ in records:
+            if name != "first load":
+                by_interaction.setdefault(name.split(':')[0], []).append(latency)
+        for name, values in sorted(by_interaction.items()):
+            print(f"  {name:<15} {percentiles(values)}")
+
+    print(f"Server memory before sessions: RSS {baseline[0] / 1024:.0f} MB, PSS {baseline[1] / 1024:.0f} MB")
+    if samples:
+        print("Server memory by concurrent sessions (max over the samples):")
+        by_active = {}
+        for _, active, rss, pss in samples:
+            current = by_active.get(active, (0, 0))
+            by_active[active] = (max(current[0], rss), max(current[1], pss))
+        for active, (rss, pss) in sorted(by_active.items()):
+            print(f"  {active:>4} sessions: RSS {rss / 1024:.0f} MB, PSS {pss / 1024:.0f} MB")
+        print(f"Server memory peak: RSS {max(s[2] for s in samples) / 1024:.0f} MB, "
+              f"PSS {max(s[3] for s in samples) / 1024:.0f} MB")
+
+    for error in sorted(set(app_errors)):
+        print(f"App exception: {error}")
+    for session in sessions:
+        if session['error']:
+            print(f"Session {session['session_id']} aborted after {len(session['records'])} interaction(s):\n{session['error']}")
+
+
+async def run_load_test(args, base_url, pid):
+    if not args.cold:
+        # Fill the server caches once, so the timed sessions measure a warm server
+        warmup = Session(base_url, random.Random(args.seed - 1), args.timeout)
+        await warmup.connect()
+        await warmup.rerun()
+        await warmup.close()
+
+    baseline = server_memory_kb(pid)
+    active = [0]
+    samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(pid, active, samples, args.sample_interval, stop))
+
+    async def delayed_session(session_id):
+        await asyncio.sleep(session_id * args.ramp)
+        return await run_session(session_id, args, base_url, active)
+
+    start = time.perf_counter()
+    sessions = await asyncio.gather(*(delayed_session(i) for i in range(args.sessions)))
+    wall_time = time.perf_counter() - start
+    stop.set()
+    await sampler
+
+    report(sessions, args, wall_time, baseline, samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the Land Cover Scenario Viewer")
+    parser.add_argument('--sessions', type=int, default=10, help="Number of concurrent sessions")
+    parser.add_argument('--steps', type=int, default=10, help="Interactions per session after the first load")
+    parser.add_argument('--ramp', type=float, default=1, help="Delay between the start of two sessions (s)")
+    parser.add_argument('--think-time', type=float, default=1, help="Pause between two interactions of a session (s)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random interactions")
+    parser.add_argument('--timeout', type=float, default=300, help="Timeout of a single script run (s)")
+    parser.add_argument('--sample-interval', type=float, default=0.5, help="Interval between memory samples (s)")
+    parser.add_argument('--cold', action='store_true', help="Skip the warm-up run, so the first session fills the caches")
+    parser.add_argument('--port', type=int, default=0, help="Port of the server, a free port by default")
+    parser.add_argument('--log', default="load_test_server.log", help="File receiving the server output")
+    args = parser.parse_args()
+
+    port = args.port
+    if not port:
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            port = sock.getsockname()[1]
+
+    with open(args.log, 'w') as log_file:
+        server = start_server(port, log_file)
+        try:
+            asyncio.run(run_load_test(args, f"http://localhost:{port}", server.pid))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()